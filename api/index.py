@@ -1,6 +1,6 @@
 """
 Vercel serverless function entry point.
-Wraps the FastAPI app for Vercel's Python runtime.
+Exports the FastAPI app directly; Vercel's Python runtime speaks ASGI.
 This handles ALL /api/* routes through FastAPI.
 """
 
@@ -14,47 +14,35 @@ if backend_path not in sys.path:
 
 # Set environment
 os.environ.setdefault('PYTHONUNBUFFERED', '1')
+os.environ.setdefault('FASTAPI_ROOT_PATH', '/api')  # Vercel serves under /api
 
 try:
-    # Import the FastAPI app
+    # Import the FastAPI app. This also builds RAGPipeline, which creates
+    # the cached chunker (tiktoken vocab + splitter), so no separate
+    # prewarm is needed here.
     from main import app
-    
-    # Create ASGI handler for Vercel
-    # Vercel will route /api/* to this function
-    from mangum import Mangum
-    handler = Mangum(app, lifespan="off")
-    
-    # Vercel expects 'app' or 'handler' to be exported
-    # Export both for compatibility
-    __all__ = ['handler', 'app']
-    
-except ImportError as ie:
-    # Mangum not installed, try direct export
-    try:
-        from main import app
-        handler = app
-        __all__ = ['handler', 'app']
-    except Exception as e:
-        # Fallback error handler
-        from fastapi import FastAPI
-        from fastapi.responses import JSONResponse
-        
-        app = FastAPI()
-        
-        @app.get("/{path:path}")
-        @app.post("/{path:path}")
-        async def error_handler(path: str):
-            return JSONResponse(
-                status_code=500,
-                content={
-                    "error": "Failed to initialize application",
-                    "details": str(e),
-                    "import_error": str(ie) if 'ie' in locals() else None,
-                    "path": path,
-                    "backend_path": backend_path,
-                    "sys_path": sys.path
-                }
-            )
-        
-        handler = app
-        __all__ = ['handler', 'app']
+
+except Exception as e:
+    # Fallback error handler
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse
+
+    init_error = str(e)
+    app = FastAPI()
+
+    @app.get("/{path:path}")
+    @app.post("/{path:path}")
+    async def error_handler(path: str):
+        return JSONResponse(
+            status_code=500,
+            content={
+                "error": "Failed to initialize application",
+                "details": init_error,
+                "path": path,
+                "backend_path": backend_path,
+            }
+        )
+
+# Vercel expects 'app' or 'handler' to be exported
+handler = app
+__all__ = ['handler', 'app']
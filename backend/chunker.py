@@ -3,41 +3,235 @@ Text chunking module.
 Splits documents into overlapping chunks with metadata preservation.
 """
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Callable, Tuple, Iterable
+from bisect import bisect_left, bisect_right
+import functools
+import os
+import re
 import tiktoken
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+
+@functools.lru_cache(maxsize=1)
+def _shared_encoding() -> tiktoken.Encoding:
+    """Load the cl100k_base BPE tables once per process and share them."""
+    return tiktoken.get_encoding("cl100k_base")
+
+
+class FastRecursiveSplitter:
+    """
+    Token-aware splitter that finds all break points in a single regex scan.
+    
+    Mirrors the separator priority of a recursive splitter ("\\n\\n", "\\n",
+    ". ", " ", then hard cuts) but tokenizes the document once and packs
+    chunks greedily using the cached token offsets.
+    """
+    
+    # Separator -> priority (lower is preferred)
+    SEPARATOR_RANKS = {"\n\n": 0, "\n": 1, ". ": 2, " ": 3}
+    BOUNDARY_PATTERN = re.compile(r"\n\n|\n|\. | ")
+    
+    def __init__(self, encoding: tiktoken.Encoding, chunk_size: int, chunk_overlap: int):
+        """
+        Initialize splitter.
+        
+        Args:
+            encoding: tiktoken encoding used for token offsets
+            chunk_size: Maximum tokens per chunk
+            chunk_overlap: Overlapping tokens between chunks
+        """
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+    
+    def _boundaries(self, text: str):
+        """Return sorted break positions and their separator ranks."""
+        positions = []
+        ranks = []
+        for match in self.BOUNDARY_PATTERN.finditer(text):
+            sep = match.group()
+            # Keep the period with its sentence; whitespace starts the next piece
+            positions.append(match.start() + 1 if sep == ". " else match.start())
+            ranks.append(self.SEPARATOR_RANKS[sep])
+        return positions, ranks
+    
+    def split_text(self, text: str) -> List[str]:
+        """
+        Split text into chunks of about chunk_size tokens.
+        
+        Chunks are packed by the document's own token offsets, so a chunk
+        holds at most chunk_size of those tokens. Re-encoded on its own, a
+        chunk can come out a few tokens longer where a cut lands inside a
+        multi-byte character.
+        
+        Args:
+            text: Input text
+        
+        Returns:
+            List of chunk strings (whitespace-stripped, non-empty)
+        """
+        tokens = self.encoding.encode_ordinary(text)
+        if not tokens:
+            return []
+        
+        # Character offset where each token starts, plus an end sentinel
+        _, offsets = self.encoding.decode_with_offsets(tokens)
+        offsets.append(len(text))
+        n_tokens = len(tokens)
+        
+        positions, ranks = self._boundaries(text)
+        
+        chunks = []
+        start = 0
+        prev_end = 0
+        while start < len(text):
+            start_tok = bisect_right(offsets, start) - 1
+            limit_tok = start_tok + self.chunk_size
+            
+            if limit_tok >= n_tokens:
+                end = len(text)
+            else:
+                limit_char = offsets[limit_tok]
+                # Only break points past the previous chunk's end, so overlapped
+                # chunks always make progress
+                lo = bisect_right(positions, max(start, prev_end))
+                hi = bisect_right(positions, limit_char)
+                if lo < hi:
+                    # Best-ranked separator in the window, furthest one on ties
+                    best = min(range(lo, hi), key=lambda i: (ranks[i], -positions[i]))
+                    end = positions[best]
+                else:
+                    end = limit_char
+            if end <= max(start, prev_end):
+                end = max(start, prev_end) + 1
+            
+            chunk = text[start:end].strip()
+            if chunk:
+                chunks.append(chunk)
+            if end >= len(text):
+                break
+            prev_end = end
+            
+            # Step back by up to chunk_overlap tokens, snapped to a break point
+            next_start = end
+            if self.chunk_overlap > 0:
+                end_tok = bisect_right(offsets, end) - 1
+                back_char = offsets[max(end_tok - self.chunk_overlap, 0)]
+                idx = bisect_left(positions, back_char)
+                if idx < len(positions) and start < positions[idx] < end:
+                    next_start = positions[idx]
+                elif start < back_char < end:
+                    # No separator in the overlap window: cut mid-text so the
+                    # overlap is kept (the old "" separator behaviour)
+                    next_start = back_char
+            start = next_start
+        
+        return chunks
+
+
+def _join_chunks(left: str, right: str) -> str:
+    """Join two adjacent chunks, dropping any overlap they share."""
+    probe = right[:16]
+    idx = left.find(probe)
+    while idx != -1:
+        if right.startswith(left[idx:]):
+            return left + right[len(left) - idx:]
+        idx = left.find(probe, idx + 1)
+    return left + "\n" + right
+
+
+def _merge_small(
+    chunks: List[str],
+    counts: List[int],
+    min_tokens: int,
+    max_tokens: int,
+    count_fn: Callable[[str], int],
+    split_fn: Optional[Callable[[str], List[str]]] = None,
+) -> Tuple[List[str], List[int]]:
+    """
+    Merge tiny chunks into their neighbours and re-split oversized outliers.
+    
+    Args:
+        chunks: Chunk texts in document order
+        counts: Token count of each chunk
+        min_tokens: Chunks below this size are merged with a neighbour
+        max_tokens: Upper bound for a merged chunk
+        count_fn: Token counter for merged text
+        split_fn: Splitter used to break up chunks larger than max_tokens
+    
+    Returns:
+        Tuple of (merged chunk texts, their token counts)
+    """
+    merged: List[str] = []
+    merged_counts: List[int] = []
+    
+    for chunk, count in zip(chunks, counts):
+        if count > max_tokens and split_fn is not None:
+            pieces = split_fn(chunk)
+            pending = [(piece, count_fn(piece)) for piece in pieces]
+        else:
+            pending = [(chunk, count)]
+        
+        for piece, piece_count in pending:
+            if merged and (merged_counts[-1] < min_tokens or piece_count < min_tokens):
+                if merged_counts[-1] + piece_count <= max_tokens:
+                    candidate = _join_chunks(merged[-1], piece)
+                    candidate_count = count_fn(candidate)
+                    if candidate_count <= max_tokens:
+                        merged[-1] = candidate
+                        merged_counts[-1] = candidate_count
+                        continue
+            merged.append(piece)
+            merged_counts.append(piece_count)
+    
+    return merged, merged_counts
 
 
 class DocumentChunker:
     """Handles document chunking with token-aware splitting."""
     
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 150):
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 150,
+        encoding: Optional[tiktoken.Encoding] = None,
+        min_chunk_tokens: int = 100,
+    ):
         """
         Initialize chunker with specified parameters.
         
         Args:
             chunk_size: Maximum tokens per chunk
             chunk_overlap: Overlapping tokens between chunks
+            encoding: tiktoken encoding to use (defaults to the shared cl100k_base)
+            min_chunk_tokens: Chunks smaller than this are merged with a neighbour
         """
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.min_chunk_tokens = min_chunk_tokens
+        # Merged chunks may exceed chunk_size slightly rather than stay tiny
+        self.max_merged_tokens = int(chunk_size * 1.15)
         
         # Use tiktoken for accurate token counting (GPT tokenizer)
-        self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.encoding = encoding or _shared_encoding()
+        self._count = lambda t: len(self.encoding.encode_ordinary(t))
         
-        # LangChain's recursive splitter with token counting
-        self.text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            encoding_name="cl100k_base",
+        # Single-scan recursive splitter sharing the same encoder
+        self.text_splitter = FastRecursiveSplitter(
+            encoding=self.encoding,
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
-            separators=["\n\n", "\n", ". ", " ", ""],
         )
     
+    @staticmethod
+    def shared_encoding() -> tiktoken.Encoding:
+        """The process-wide cl100k_base encoding used by default."""
+        return _shared_encoding()
+    
     def chunk_text(
         self, 
         text: str, 
         metadata: Dict[str, Any] = None
-    ) -> List[Dict[str, Any]]:
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
         """
         Chunk text into overlapping segments with metadata.
         
@@ -46,14 +240,104 @@ class DocumentChunker:
             metadata: Additional metadata (source, title, etc.)
         
         Returns:
-            List of chunk dictionaries with text and metadata
+            Tuple of (chunk dictionaries with text and metadata, chunk stats)
         """
         if not text or not text.strip():
-            return []
+            return [], self._stats([])
         
-        # Split text using LangChain
+        # Split text, then fold tiny fragments into their neighbours
         chunks = self.text_splitter.split_text(text)
+        chunks, counts = self._merge(chunks, self._count_batch(chunks))
+        
+        return self._build_chunks(chunks, counts, metadata), self._stats(counts)
+    
+    def chunk_texts(
+        self,
+        parts: Iterable[str],
+        metadata: Dict[str, Any] = None,
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        Chunk one document supplied as consecutive parts (e.g. PDF pages).
+        
+        Each part is split on its own, so the full document is never joined
+        into one string; chunk indices run across all parts.
+        
+        Args:
+            parts: Document parts in order
+            metadata: Additional metadata (source, title, etc.)
+        
+        Returns:
+            Tuple of (chunk dictionaries with text and metadata, chunk stats)
+        """
+        chunks = []
+        for part in parts:
+            if part and part.strip():
+                chunks.extend(self.text_splitter.split_text(part))
+        
+        chunks, counts = self._merge(chunks, self._count_batch(chunks))
+        
+        return self._build_chunks(chunks, counts, metadata), self._stats(counts)
+    
+    def chunk_documents(
+        self,
+        texts: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ) -> List[Tuple[List[Dict[str, Any]], Dict[str, int]]]:
+        """
+        Chunk several documents, counting tokens for all of them in one batch.
+        
+        Args:
+            texts: Input documents
+            metadatas: Optional per-document metadata, aligned with texts
         
+        Returns:
+            One (chunk dictionaries, chunk stats) tuple per input document
+        """
+        metadatas = metadatas or [None] * len(texts)
+        split_docs = [
+            self.text_splitter.split_text(text) if text and text.strip() else []
+            for text in texts
+        ]
+        
+        # Single parallel token-count call over every chunk of every document
+        flat_counts = self._count_batch([c for chunks in split_docs for c in chunks])
+        
+        results = []
+        offset = 0
+        for chunks, metadata in zip(split_docs, metadatas):
+            counts = flat_counts[offset:offset + len(chunks)]
+            offset += len(chunks)
+            chunks, counts = self._merge(chunks, counts)
+            results.append((self._build_chunks(chunks, counts, metadata), self._stats(counts)))
+        
+        return results
+    
+    def _merge(self, chunks: List[str], counts: List[int]) -> Tuple[List[str], List[int]]:
+        """Second pass: merge small chunks and re-split oversized ones."""
+        return _merge_small(
+            chunks,
+            counts,
+            min_tokens=self.min_chunk_tokens,
+            max_tokens=self.max_merged_tokens,
+            count_fn=self._count,
+            split_fn=self.text_splitter.split_text,
+        )
+    
+    @staticmethod
+    def _stats(token_counts: List[int]) -> Dict[str, int]:
+        """Summary stats from the token counts already computed while chunking."""
+        return {
+            "total_chunks": len(token_counts),
+            "avg_chunk_size": sum(token_counts) // len(token_counts) if token_counts else 0,
+        }
+    
+    def _build_chunks(
+        self,
+        chunks: List[str],
+        token_counts: List[int],
+        metadata: Optional[Dict[str, Any]],
+    ) -> List[Dict[str, Any]]:
+        """Wrap split chunk texts with metadata and token counts."""
         # Prepare metadata
         base_metadata = metadata or {}
         
@@ -67,13 +351,29 @@ class DocumentChunker:
                     "chunk_index": idx,
                     "total_chunks": len(chunks),
                     "position": idx,
-                    "token_count": len(self.encoding.encode(chunk_text)),
+                    "token_count": token_counts[idx],
                 }
             }
             chunk_objects.append(chunk_obj)
         
         return chunk_objects
     
+    def _count_batch(self, texts: List[str]) -> List[int]:
+        """Token counts for many texts in one batched encode."""
+        if not texts:
+            return []
+        # One batched call: tiktoken releases the GIL and encodes across threads
+        token_lists = self.encoding.encode_ordinary_batch(
+            texts, num_threads=max(1, os.cpu_count() or 1)
+        )
+        return [len(tokens) for tokens in token_lists]
+    
     def get_token_count(self, text: str) -> int:
         """Get token count for a given text."""
-        return len(self.encoding.encode(text))
+        return self._count(text)
+
+
+@functools.lru_cache(maxsize=8)
+def get_chunker(chunk_size: int, chunk_overlap: int) -> DocumentChunker:
+    """Return a cached DocumentChunker for the given parameters."""
+    return DocumentChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
@@ -3,8 +3,10 @@ Configuration module for Mini RAG application.
 Loads environment variables and provides app-wide settings.
 """
 
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import Optional
+import functools
+import os
 
 
 class Settings(BaseSettings):
@@ -24,6 +26,15 @@ class Settings(BaseSettings):
     collection_name: str = "mini_rag_docs"
     embedding_model: str = "models/embedding-001"
     vector_dimensions: int = 768
+    embedding_batch_size: int = 100  # Texts per batchEmbedContents call
+    embed_concurrency: int = 8  # Parallel embedding requests
+    upsert_batch_size: int = 256  # Points per Qdrant upsert request
+    embedding_cache_size: int = 4096  # In-process query/chunk embedding LRU
+    
+    # HNSW index (build-time m/ef_construct apply to new collections)
+    hnsw_m: int = 32
+    hnsw_ef_construct: int = 200
+    hnsw_ef_search: int = 128
     
     # LLM Settings
     llm_model: str = "gemini-pro"
@@ -33,17 +44,40 @@ class Settings(BaseSettings):
     top_k_rerank: int = 5
     similarity_threshold: float = 0.7
     use_reranker: bool = True
+    use_mmr: bool = True  # MMR shortlist before reranking
+    top_k_rerank_input: int = 8  # Candidates passed to the reranker after MMR
+    mmr_lambda: float = 0.5  # 1.0 = pure relevance, 0.0 = pure diversity
+    reranker_backend: str = "jina"  # "jina" (API) or "local" (ONNX cross-encoder)
+    local_reranker_model_path: str = "bge-reranker-base.int8.onnx"
+    local_reranker_tokenizer: str = "BAAI/bge-reranker-base"
+    
+    # Semantic answer cache (paraphrased queries reuse earlier answers)
+    use_query_cache: bool = True
+    query_cache_collection: str = "mini_rag_query_cache"
+    query_cache_threshold: float = 0.97
+    query_cache_ttl_seconds: int = 86400
     
     # Server Settings
     host: str = "0.0.0.0"
     port: int = 8000
+    debug: bool = False  # Verbose per-request logging
     
-    class Config:
-        # .env file is optional - will use system environment variables in production
-        env_file = ".env"
-        env_file_encoding = 'utf-8'
-        case_sensitive = False
-        extra = "ignore"
+    model_config = SettingsConfigDict(
+        # .env file is optional - serverless (Vercel sets VERCEL=1) skips the
+        # file lookup and uses system environment variables only
+        env_file=None if os.getenv("VERCEL") else ".env",
+        env_file_encoding='utf-8',
+        case_sensitive=False,
+        extra="ignore",
+        frozen=True,
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Build settings once per process."""
+    return Settings()
+
 
 # Global settings instance
-settings = Settings()
+settings = get_settings()
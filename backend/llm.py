@@ -3,25 +3,51 @@ LLM module for answer generation using Google Gemini.
 Generates grounded answers with inline citations.
 """
 
-from typing import List, Dict, Any
-from langchain_google_genai import ChatGoogleGenerativeAI
+from typing import List, Dict, Any, AsyncIterator
 from config import settings
+from chunker import DocumentChunker
+import asyncio
 import time
 
 
+# Citation instructions, sent as the system message
+SYSTEM_PROMPT = """You are a helpful assistant that answers questions based ONLY on the provided context.
+
+INSTRUCTIONS:
+1. Answer the question using ONLY information from the context.
+2. Use inline citations [1], [2], [3] etc. to reference the sources.
+3. If the context doesn't contain enough information to fully answer the question, say so.
+4. Be concise but comprehensive.
+5. Do not make up information or use external knowledge."""
+
+USER_TEMPLATE = "CONTEXT:\n{ctx}\n\nQUESTION: {q}\n\nANSWER:"
+
+# Fallback answers; never worth caching
+NO_ANSWER_MESSAGE = "I received the documents but couldn't generate an answer. Please try again."
+RATE_LIMIT_MESSAGE = "I'm experiencing rate limits with the AI service. Please wait a moment and try again."
+FALLBACK_ANSWERS = (NO_ANSWER_MESSAGE, RATE_LIMIT_MESSAGE)
+
+
 class LLMGenerator:
     """Generates answers using Google Gemini with citation support."""
     
     def __init__(self):
         """Initialize Gemini LLM."""
+        # Imported here: the Gemini client pulls in protobuf/grpc, which is
+        # only worth paying for once an answer is actually generated
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        
         self.model = ChatGoogleGenerativeAI(
             model="gemini-2.0-flash-exp",
             google_api_key=settings.google_api_key,
             temperature=0.3,
         )
         print(f"Using Gemini model via LangChain: gemini-2.0-flash")
+        
+        # Reuse the chunker's already-loaded BPE vocab for token counts
+        self._encode = DocumentChunker.shared_encoding().encode_ordinary
     
-    def generate_answer(
+    async def generate_answer(
         self, 
         query: str, 
         context_chunks: List[Dict[str, Any]]
@@ -29,12 +55,15 @@ class LLMGenerator:
         """
         Generate an answer based on retrieved context.
         
+        Consumes generate_answer_stream and assembles the full answer.
+        
         Args:
             query: User's question
             context_chunks: List of relevant chunks with text and metadata
         
         Returns:
-            Dictionary with answer, sources, and metadata
+            Dictionary with answer, sources, and metadata ("usage" holds
+            provider-reported token counts when available)
         """
         start_time = time.time()
         
@@ -47,85 +76,33 @@ class LLMGenerator:
                 "time_seconds": round(time.time() - start_time, 2),
             }
         
-        # Build context with numbered sources
-        context_text = ""
         sources = []
-        
-        for idx, chunk in enumerate(context_chunks, start=1):
-            context_text += f"\n[{idx}] {chunk['text']}\n"
-            
-            # Prepare source metadata
-            metadata = chunk.get("metadata", {})
-            source_info = {
-                "citation_id": idx,
-                "text": chunk["text"][:200] + "..." if len(chunk["text"]) > 200 else chunk["text"],
-                "score": chunk.get("score", chunk.get("rerank_score", 0)),
-                "source": metadata.get("source", "Unknown"),
-                "chunk_index": metadata.get("chunk_index", 0),
-            }
-            sources.append(source_info)
-        
-        # Create prompt with instructions for citation
-        prompt = f"""You are a helpful assistant that answers questions based ONLY on the provided context.
-
-CONTEXT:
-{context_text}
-
-INSTRUCTIONS:
-1. Answer the question using ONLY information from the context above.
-2. Use inline citations [1], [2], [3] etc. to reference the sources.
-3. If the context doesn't contain enough information to fully answer the question, say so.
-4. Be concise but comprehensive.
-5. Do not make up information or use external knowledge.
-
-QUESTION: {query}
-
-ANSWER:"""
-        
-        # Generate response with retry logic
-        max_retries = 3
-        answer = ""
+        confidence = "low"
+        answer_parts = []
+        usage = None
         
         try:
-            for attempt in range(max_retries):
-                try:
-                    print(f"Attempting LLM call (attempt {attempt + 1}/{max_retries})...")
-                    response = self.model.invoke(prompt)
-                    answer = response.content
-                    print(f"LLM Response received: {len(answer)} chars")
-                    if answer:
-                        print(f"Answer preview: {answer[:200]}...")
-                    break
-                except Exception as e:
-                    error_msg = str(e)
-                    print(f"LLM error on attempt {attempt + 1}: {error_msg}")
-                    
-                    if "Resource exhausted" in error_msg or "429" in error_msg or "rate" in error_msg.lower():
-                        if attempt < max_retries - 1:
-                            wait_time = (attempt + 1) * 5  # Longer waits: 5s, 10s, 15s
-                            print(f"Rate limit hit, waiting {wait_time}s...")
-                            time.sleep(wait_time)
-                            continue
-                        else:
-                            print("Max retries reached, returning fallback response")
-                            answer = "I'm experiencing rate limits with the AI service. Please wait a moment and try again."
-                            break
-                    else:
-                        # Non-rate-limit error, raise it
-                        raise
+            async for event in self.generate_answer_stream(query, context_chunks):
+                if event["type"] == "sources":
+                    sources = event["sources"]
+                    confidence = event["confidence"]
+                elif event["type"] == "usage":
+                    usage = {
+                        "prompt_tokens": event["prompt_tokens"],
+                        "completion_tokens": event["completion_tokens"],
+                    }
+                else:
+                    answer_parts.append(event["text"])
+            
+            answer = "".join(answer_parts)
+            if settings.debug:
+                print(f"LLM Response received: {len(answer)} chars")
+                if answer:
+                    print(f"Answer preview: {answer[:200]}...")
             
             if not answer:
                 print("Warning: LLM returned empty answer!")
-                answer = "I received the documents but couldn't generate an answer. Please try again."
-            
-            # Calculate confidence based on source quality
-            avg_score = sum(s["score"] for s in sources) / len(sources)
-            if avg_score >= 0.8:
-                confidence = "high"
-            elif avg_score >= 0.6:
-                confidence = "medium"
-            else:
-                confidence = "low"
+                answer = NO_ANSWER_MESSAGE
             
             elapsed_time = time.time() - start_time
             
@@ -135,6 +112,7 @@ ANSWER:"""
                 "confidence": confidence,
                 "time_seconds": round(elapsed_time, 2),
                 "num_sources": len(sources),
+                "usage": usage,
             }
         
         except Exception as e:
@@ -146,26 +124,137 @@ ANSWER:"""
                 "time_seconds": round(time.time() - start_time, 2),
             }
     
+    async def generate_answer_stream(
+        self,
+        query: str,
+        context_chunks: List[Dict[str, Any]]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream an answer based on retrieved context.
+        
+        Yields one {"type": "sources", "sources", "confidence"} event, then
+        {"type": "token", "text"} events as the model produces them, and
+        finally a {"type": "usage", "prompt_tokens", "completion_tokens"}
+        event when the provider reports token usage.
+        
+        Args:
+            query: User's question
+            context_chunks: List of relevant chunks with text and metadata
+        """
+        from langchain_core.messages import SystemMessage, HumanMessage
+        
+        # Build context with numbered sources
+        context_parts = []
+        sources = []
+        score_sum = 0.0
+        
+        for idx, chunk in enumerate(context_chunks, start=1):
+            text = chunk["text"]
+            context_parts.append(f"\n[{idx}] {text}\n")
+            
+            # Prepare source metadata
+            metadata = chunk.get("metadata", {})
+            source_info = {
+                "citation_id": idx,
+                "text": text if len(text) <= 200 else text[:200] + "...",
+                "score": chunk.get("score", chunk.get("rerank_score", 0)),
+                "source": metadata.get("source", "Unknown"),
+                "chunk_index": metadata.get("chunk_index", 0),
+            }
+            sources.append(source_info)
+            score_sum += source_info["score"]
+        
+        # Calculate confidence based on source quality
+        avg_score = score_sum / len(sources) if sources else 0.0
+        confidence = ("low", "medium", "high")[(avg_score >= 0.6) + (avg_score >= 0.8)]
+        yield {"type": "sources", "sources": sources, "confidence": confidence}
+        
+        if not context_chunks:
+            yield {"type": "token", "text": "I couldn't find any relevant information to answer your question."}
+            return
+        
+        context_text = "".join(context_parts)
+        
+        # Fixed instructions go in the system message (identical bytes on
+        # every request); only the context and question vary
+        messages = [
+            SystemMessage(content=SYSTEM_PROMPT),
+            HumanMessage(content=USER_TEMPLATE.format(ctx=context_text, q=query)),
+        ]
+        
+        # Stream response with retry logic; a retry is only possible while
+        # nothing has been sent to the client yet
+        max_retries = 3
+        
+        for attempt in range(max_retries):
+            emitted = False
+            try:
+                if settings.debug:
+                    print(f"Attempting LLM call (attempt {attempt + 1}/{max_retries})...")
+                prompt_tokens = completion_tokens = 0
+                has_usage = False
+                async for chunk in self.model.astream(messages):
+                    if chunk.content:
+                        emitted = True
+                        yield {"type": "token", "text": chunk.content}
+                    # Token usage as counted by the provider. Gemini reports
+                    # cumulative totals (prompt repeated) on each chunk, so
+                    # keep the largest value seen rather than summing.
+                    usage = getattr(chunk, "usage_metadata", None)
+                    if usage:
+                        has_usage = True
+                        prompt_tokens = max(prompt_tokens, usage.get("input_tokens", 0))
+                        completion_tokens = max(completion_tokens, usage.get("output_tokens", 0))
+                if has_usage:
+                    yield {
+                        "type": "usage",
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                    }
+                return
+            except Exception as e:
+                error_msg = str(e)
+                print(f"LLM error on attempt {attempt + 1}: {error_msg}")
+                
+                if emitted:
+                    raise
+                if "Resource exhausted" in error_msg or "429" in error_msg or "rate" in error_msg.lower():
+                    if attempt < max_retries - 1:
+                        wait_time = (attempt + 1) * 5  # Longer waits: 5s, 10s, 15s
+                        print(f"Rate limit hit, waiting {wait_time}s...")
+                        await asyncio.sleep(wait_time)
+                        continue
+                    else:
+                        print("Max retries reached, returning fallback response")
+                        yield {
+                            "type": "token",
+                            "text": RATE_LIMIT_MESSAGE,
+                        }
+                        return
+                else:
+                    # Non-rate-limit error, raise it
+                    raise
+    
     def estimate_tokens(self, text: str) -> int:
         """
-        Rough token estimation (4 chars ≈ 1 token).
+        Token count using the shared cl100k_base encoding.
         
         Args:
             text: Input text
         
         Returns:
-            Estimated token count
+            Token count
         """
-        return len(text) // 4
+        return len(self._encode(text))
     
-    def estimate_cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+    def estimate_cost(self, prompt_chars: int, completion_chars: int) -> float:
         """
         Estimate API cost for Gemini Pro.
         (Free tier: 60 requests/minute)
         
         Args:
-            prompt_tokens: Input token count
-            completion_tokens: Output token count
+            prompt_chars: Input character count
+            completion_chars: Output character count
         
         Returns:
             Estimated cost in USD
@@ -175,7 +264,7 @@ ANSWER:"""
         # $0.00025 per 1K characters for input
         # $0.0005 per 1K characters for output
         
-        input_cost = (prompt_tokens * 4) / 1000 * 0.00025
-        output_cost = (completion_tokens * 4) / 1000 * 0.0005
+        input_cost = prompt_chars / 1000 * 0.00025
+        output_cost = completion_chars / 1000 * 0.0005
         
         return round(input_cost + output_cost, 6)
@@ -5,13 +5,15 @@ Provides REST API endpoints for document ingestion and querying.
 
 from fastapi import FastAPI, HTTPException, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, BinaryIO
 from rag_pipeline import RAGPipeline
 from config import settings
 import time
-import pypdf
-import io
+import codecs
+import orjson
+import os
 
 
 # Initialize FastAPI app
@@ -19,7 +21,8 @@ app = FastAPI(
     title="Mini RAG API",
     description="Retrieval-Augmented Generation API with Qdrant, Gemini, and Jina",
     version="1.0.0",
-    root_path="/api"  # For Vercel serverless routing
+    # "/api" under Vercel (set by api/index.py); empty for local/Cloud Run
+    root_path=os.getenv("FASTAPI_ROOT_PATH", ""),
 )
 
 # CORS configuration for frontend
@@ -55,6 +58,11 @@ class QueryRequest(BaseModel):
     query: str = Field(..., description="User's question")
 
 
+class DeleteDocumentsRequest(BaseModel):
+    """Request model for deleting specific documents."""
+    document_ids: List[str] = Field(..., description="Document identifiers to delete")
+
+
 class IngestResponse(BaseModel):
     """Response model for ingestion."""
     status: str
@@ -83,6 +91,41 @@ class QueryResponse(BaseModel):
     token_stats: Optional[Dict[str, int]] = None
     estimated_cost_usd: Optional[float] = None
     retrieval_stats: Optional[Dict[str, int]] = None
+    cached: bool = False
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Release pooled HTTP connections."""
+    if rag is not None:
+        await rag.reranker.aclose()
+
+
+def extract_pdf_pages(stream: BinaryIO):
+    """Yield the text of each PDF page from a file-like object, one page at a time."""
+    # PDF parsers are imported lazily so text-only and query workloads
+    # never load them. Native PDFium when available; pypdf is the fallback.
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        pdfium = None
+    
+    if pdfium is not None:
+        pdf = pdfium.PdfDocument(stream)
+        try:
+            for i in range(len(pdf)):
+                page = pdf[i]
+                textpage = page.get_textpage()
+                yield textpage.get_text_range()
+                textpage.close()
+                page.close()
+        finally:
+            pdf.close()
+    else:
+        import pypdf
+        pdf_reader = pypdf.PdfReader(stream)
+        for page in pdf_reader.pages:
+            yield page.extract_text() or ""
 
 
 # API Endpoints
@@ -152,27 +195,30 @@ async def ingest_file(file: UploadFile = File(...)):
     Ingest a document from file upload (PDF, TXT, or DOCX).
     """
     try:
-        # Read file content
-        content = await file.read()
+        # Parse straight from the upload's spooled temp file rather than
+        # copying it into bytes and a BytesIO wrapper
+        stream = file.file
+        stream.seek(0)
+        
+        metadata = {
+            "source": file.filename,
+            "title": file.filename,
+        }
         
         # Extract text based on file type
         if file.filename.endswith(".pdf"):
-            # Parse PDF
-            pdf_file = io.BytesIO(content)
-            pdf_reader = pypdf.PdfReader(pdf_file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
+            # Parse PDF lazily, page by page; pages are chunked without
+            # ever being joined into one string
+            return rag.ingest_pages(extract_pdf_pages(stream), metadata)
         
         elif file.filename.endswith(".txt"):
             # Plain text
-            text = content.decode("utf-8")
+            text = codecs.getreader("utf-8")(stream).read()
         
         elif file.filename.endswith(".docx"):
             # Parse DOCX
             from docx import Document
-            doc_file = io.BytesIO(content)
-            doc = Document(doc_file)
+            doc = Document(stream)
             text = "\n".join([para.text for para in doc.paragraphs])
         
         else:
@@ -182,11 +228,6 @@ async def ingest_file(file: UploadFile = File(...)):
             )
         
         # Ingest the extracted text
-        metadata = {
-            "source": file.filename,
-            "title": file.filename,
-        }
-        
         result = rag.ingest_document(text, metadata)
         
         return result
@@ -208,13 +249,32 @@ async def query_knowledge_base(request: QueryRequest):
     3. Generate an answer with citations using Gemini
     """
     try:
-        result = rag.query(request.query)
+        result = await rag.query(request.query)
         return result
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
 
 
+@app.post("/query/stream")
+async def query_knowledge_base_stream(request: QueryRequest):
+    """
+    Query the knowledge base, streaming the answer as server-sent events.
+    
+    Emits a "sources" event, then "token" events as the answer is
+    generated, and finally a "done" event with timings.
+    """
+    # Fail before streaming starts; afterwards errors arrive as "error" events
+    if rag is None:
+        raise HTTPException(status_code=500, detail=f"Query failed: {initialization_error}")
+    
+    async def event_stream():
+        async for event in rag.query_stream(request.query):
+            yield b"data: " + orjson.dumps(event) + b"\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @app.post("/retrieve")
 async def retrieve_context(request: QueryRequest):
     """
@@ -224,15 +284,16 @@ async def retrieve_context(request: QueryRequest):
     try:
         import time
         # Step 1: Retrieve chunks
-        retrieved_chunks = rag.vector_store.search(
+        retrieved_chunks = await rag.vector_store.search(
             query=request.query,
             top_k=settings.top_k_retrieval,
             score_threshold=settings.similarity_threshold,
         )
         
-        print(f"Retrieved {len(retrieved_chunks)} chunks")
-        for i, chunk in enumerate(retrieved_chunks[:3]):
-            print(f"  Chunk {i+1}: source={chunk.get('metadata', {}).get('source', 'Unknown')}, score={chunk.get('score', 0)}")
+        if settings.debug:
+            print(f"Retrieved {len(retrieved_chunks)} chunks")
+            for i, chunk in enumerate(retrieved_chunks[:3]):
+                print(f"  Chunk {i+1}: source={chunk.get('metadata', {}).get('source', 'Unknown')}, score={chunk.get('score', 0)}")
         
         if not retrieved_chunks:
             return {
@@ -241,9 +302,10 @@ async def retrieve_context(request: QueryRequest):
                 "message": "No relevant documents found"
             }
         
-        # Step 2: Optionally rerank
-        if settings.use_reranker:
-            reranked_chunks = rag.reranker.rerank(
+        # Step 2: Optionally rerank; when every chunk fits in top_k_rerank,
+        # keep the vector-score order to save a reranker round-trip
+        if settings.use_reranker and len(retrieved_chunks) > settings.top_k_rerank:
+            reranked_chunks = await rag.reranker.rerank(
                 query=request.query,
                 documents=retrieved_chunks,
                 top_k=settings.top_k_rerank,
@@ -261,6 +323,17 @@ async def retrieve_context(request: QueryRequest):
         raise HTTPException(status_code=500, detail=f"Retrieval failed: {str(e)}")
 
 
+@app.post("/documents/delete")
+async def delete_documents(request: DeleteDocumentsRequest):
+    """Delete specific documents, keeping the rest of the collection and its index."""
+    try:
+        result = rag.clear_documents(request.document_ids)
+        return result
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Delete failed: {str(e)}")
+
+
 @app.delete("/clear")
 async def clear_knowledge_base():
     """Clear all documents from the knowledge base."""
@@ -281,29 +354,13 @@ async def get_stats():
             settings.collection_name
         )
         
-        # Get unique document sources
-        scroll_result = rag.vector_store.qdrant_client.scroll(
-            collection_name=settings.collection_name,
-            limit=1000,
-            with_payload=True,
-            with_vectors=False
-        )
-        
-        unique_sources = set()
-        unique_doc_ids = set()
-        for point in scroll_result[0]:
-            if point.payload:
-                if 'source' in point.payload:
-                    unique_sources.add(point.payload['source'])
-                if 'document_id' in point.payload:
-                    unique_doc_ids.add(point.payload['document_id'])
+        # Unique documents/sources via facet counts on the payload indexes
+        doc_stats = rag.vector_store.get_document_stats()
         
         return {
             "collection_name": settings.collection_name,
             "total_vectors": collection_info.points_count,
-            "unique_documents": len(unique_doc_ids),
-            "unique_sources": len(unique_sources),
-            "source_names": list(unique_sources),
+            **doc_stats,
             "vector_dimensions": settings.vector_dimensions,
             "config": {
                 "chunk_size": settings.chunk_size,
@@ -3,12 +3,13 @@ RAG Pipeline orchestrator.
 Coordinates chunking, retrieval, reranking, and answer generation.
 """
 
-from typing import Dict, Any, List
-from chunker import DocumentChunker
-from vector_store import VectorStore
-from reranker import JinaReranker
-from llm import LLMGenerator
+from typing import Dict, Any, List, Iterable, Optional, Tuple, AsyncIterator
+from chunker import get_chunker
+from vector_store import VectorStore, mmr_select
+from reranker import get_reranker
+from llm import LLMGenerator, FALLBACK_ANSWERS
 from config import settings
+import asyncio
 import time
 
 
@@ -17,13 +18,19 @@ class RAGPipeline:
     
     def __init__(self):
         """Initialize all RAG components."""
-        self.chunker = DocumentChunker(
-            chunk_size=settings.chunk_size,
-            chunk_overlap=settings.chunk_overlap,
-        )
+        self.chunker = get_chunker(settings.chunk_size, settings.chunk_overlap)
         self.vector_store = VectorStore()
-        self.reranker = JinaReranker()
-        self.llm = LLMGenerator()
+        self.reranker = get_reranker()
+        self._llm = None
+        # Strong references to fire-and-forget tasks (answer cache writes)
+        self._background_tasks = set()
+    
+    @property
+    def llm(self) -> LLMGenerator:
+        """LLM generator, created on first use (not needed for ingest/retrieve)."""
+        if self._llm is None:
+            self._llm = LLMGenerator()
+        return self._llm
     
     def ingest_document(
         self, 
@@ -43,8 +50,36 @@ class RAGPipeline:
         start_time = time.time()
         
         # Step 1: Chunk the document
-        chunks = self.chunker.chunk_text(text, metadata)
+        chunks, chunk_stats = self.chunker.chunk_text(text, metadata)
+        
+        return self._store_chunks(chunks, chunk_stats, start_time)
+    
+    def ingest_pages(
+        self,
+        pages: Iterable[str],
+        metadata: Dict[str, Any] = None
+    ) -> Dict[str, Any]:
+        """
+        Ingest a document given as separate pages without joining them.
         
+        Args:
+            pages: Page texts in order
+            metadata: Optional metadata (source, title, etc.)
+        
+        Returns:
+            Ingestion status and statistics
+        """
+        start_time = time.time()
+        chunks, chunk_stats = self.chunker.chunk_texts(pages, metadata)
+        return self._store_chunks(chunks, chunk_stats, start_time)
+    
+    def _store_chunks(
+        self,
+        chunks: List[Dict[str, Any]],
+        chunk_stats: Dict[str, int],
+        start_time: float
+    ) -> Dict[str, Any]:
+        """Embed and store chunks, returning ingestion statistics."""
         if not chunks:
             return {
                 "status": "error",
@@ -59,13 +94,10 @@ class RAGPipeline:
         return {
             **result,
             "total_time_seconds": round(elapsed_time, 2),
-            "chunk_stats": {
-                "total_chunks": len(chunks),
-                "avg_chunk_size": sum(c["metadata"]["token_count"] for c in chunks) // len(chunks),
-            },
+            "chunk_stats": chunk_stats,
         }
     
-    def query(
+    async def query(
         self, 
         query: str,
         include_timings: bool = True,
@@ -80,22 +112,21 @@ class RAGPipeline:
         Returns:
             Answer with sources and metadata
         """
-        import time  # Ensure time is available in this scope
         timings = {}
         overall_start = time.time()
         
-        # Step 1: Retrieve top-k chunks using vector similarity
-        retrieval_start = time.time()
-        retrieved_chunks = self.vector_store.search(
-            query=query,
-            top_k=settings.top_k_retrieval,
-            score_threshold=settings.similarity_threshold,
-        )
-        timings["retrieval"] = round(time.time() - retrieval_start, 2)
+        # Step 0: Reuse the answer to a near-identical earlier query
+        cached = await self._lookup_cached_answer(query, timings)
+        if cached:
+            timings["total"] = round(time.time() - overall_start, 2)
+            return {
+                **cached,
+                "timings": timings if include_timings else None,
+                "cached": True,
+            }
         
-        print(f"Retrieved {len(retrieved_chunks)} chunks")  # Debug
-        if retrieved_chunks:
-            print(f"Top score: {retrieved_chunks[0].get('score', 0)}")  # Debug
+        # Steps 1-2: Retrieve and rerank
+        retrieved_chunks, reranked_chunks = await self._retrieve(query, timings)
         
         # Check if we have any results
         if not retrieved_chunks:
@@ -106,33 +137,29 @@ class RAGPipeline:
                 "timings": timings if include_timings else None,
             }
         
-        # Step 2: Rerank retrieved chunks (if enabled)
-        if settings.use_reranker:
-            rerank_start = time.time()
-            reranked_chunks = self.reranker.rerank(
-                query=query,
-                documents=retrieved_chunks,
-                top_k=settings.top_k_rerank,
-            )
-            timings["reranking"] = round(time.time() - rerank_start, 2)
-        else:
-            reranked_chunks = retrieved_chunks[:settings.top_k_rerank]
-            timings["reranking"] = 0
-        
         # Step 3: Generate answer with LLM
         generation_start = time.time()
-        result = self.llm.generate_answer(query, reranked_chunks)
+        result = await self.llm.generate_answer(query, reranked_chunks)
         timings["generation"] = result.get("time_seconds", 0)
         
         # Add overall timing
         timings["total"] = round(time.time() - overall_start, 2)
         
-        # Add cost estimation
-        prompt_tokens = self.llm.estimate_tokens(query + str([c["text"] for c in reranked_chunks]))
-        completion_tokens = self.llm.estimate_tokens(result["answer"])
-        estimated_cost = self.llm.estimate_cost(prompt_tokens, completion_tokens)
+        # Add cost estimation: provider-reported usage when available,
+        # otherwise the per-chunk token counts cached at ingest time
+        usage = result.pop("usage", None)
+        if usage:
+            prompt_tokens = usage["prompt_tokens"]
+            completion_tokens = usage["completion_tokens"]
+        else:
+            prompt_tokens = self.llm.estimate_tokens(query) + sum(
+                c["metadata"].get("token_count", 0) for c in reranked_chunks
+            )
+            completion_tokens = self.llm.estimate_tokens(result["answer"])
+        prompt_chars = len(query) + sum(len(c["text"]) for c in reranked_chunks)
+        estimated_cost = self.llm.estimate_cost(prompt_chars, len(result["answer"]))
         
-        return {
+        response = {
             **result,
             "timings": timings if include_timings else None,
             "token_stats": {
@@ -146,6 +173,206 @@ class RAGPipeline:
                 "after_reranking": len(reranked_chunks),
             },
         }
+        
+        self._cache_answer(query, result, overall_start)
+        return response
+    
+    async def query_stream(self, query: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Query the RAG system, streaming the answer as it is generated.
+        
+        Args:
+            query: User's question
+        
+        Yields:
+            A "sources" event, "token" events, then a final "done" event
+            with timings (or an "error" event if any step fails)
+        """
+        # The response headers are already sent, so every failure - embedding,
+        # search, rerank or generation - must surface as an "error" event
+        try:
+            async for event in self._query_stream(query):
+                yield event
+        except Exception as e:
+            print(f"Streaming query error: {e}")
+            yield {"type": "error", "message": f"An error occurred while answering the question: {str(e)}"}
+    
+    async def _query_stream(self, query: str) -> AsyncIterator[Dict[str, Any]]:
+        """Event generator behind query_stream; exceptions propagate."""
+        timings = {}
+        overall_start = time.time()
+        
+        cached = await self._lookup_cached_answer(query, timings)
+        if cached:
+            yield {"type": "sources", "sources": cached["sources"], "confidence": cached["confidence"]}
+            yield {"type": "token", "text": cached["answer"]}
+            timings["total"] = round(time.time() - overall_start, 2)
+            yield {"type": "done", "timings": timings, "cached": True}
+            return
+        
+        retrieved_chunks, reranked_chunks = await self._retrieve(query, timings)
+        
+        generation_start = time.time()
+        answer_parts = []
+        sources_event = None
+        async for event in self.llm.generate_answer_stream(query, reranked_chunks):
+            if event["type"] == "sources":
+                sources_event = event
+            elif event["type"] == "token":
+                answer_parts.append(event["text"])
+            yield event
+        timings["generation"] = round(time.time() - generation_start, 2)
+        if sources_event and sources_event["sources"]:
+            self._cache_answer(query, {
+                "answer": "".join(answer_parts),
+                "sources": sources_event["sources"],
+                "confidence": sources_event["confidence"],
+                "num_sources": len(sources_event["sources"]),
+            }, overall_start)
+        timings["total"] = round(time.time() - overall_start, 2)
+        
+        yield {
+            "type": "done",
+            "timings": timings,
+            "retrieval_stats": {
+                "initial_retrieved": len(retrieved_chunks),
+                "after_reranking": len(reranked_chunks),
+            },
+        }
+    
+    async def _lookup_cached_answer(
+        self,
+        query: str,
+        timings: Dict[str, float],
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached answer for a semantically equivalent query.
+        
+        The query embedding is cached, so retrieval reuses it on a miss.
+        
+        Returns:
+            Cached answer (answer, sources, confidence, num_sources) or None
+        """
+        if not settings.use_query_cache:
+            return None
+        
+        lookup_start = time.time()
+        query_vector = await self.vector_store.embed_query(query)
+        cached = await self.vector_store.lookup_cached_answer(query_vector)
+        timings["cache_lookup"] = round(time.time() - lookup_start, 2)
+        if not cached:
+            return None
+        
+        return {
+            "answer": cached["answer"],
+            "sources": cached["sources"],
+            "confidence": cached["confidence"],
+            "num_sources": cached["num_sources"],
+        }
+    
+    def _cache_answer(self, query: str, result: Dict[str, Any], started_at: float):
+        """
+        Cache a generated answer in the background, off the request path.
+        
+        Errors, fallbacks and empty answers are never cached.
+        
+        Args:
+            query: User's question
+            result: Generated answer with sources, confidence and num_sources
+            started_at: Time the query started, checked against invalidations
+        """
+        if not settings.use_query_cache:
+            return
+        answer = result["answer"]
+        if "num_sources" not in result or not answer.strip() or answer in FALLBACK_ANSWERS:
+            return
+        
+        task = asyncio.create_task(self._write_cached_answer(query, {
+            "answer": answer,
+            "sources": result["sources"],
+            "confidence": result["confidence"],
+            "num_sources": result["num_sources"],
+        }, started_at))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _write_cached_answer(self, query: str, payload: Dict[str, Any], started_at: float):
+        """Embed (cache hit) and store one answer cache entry."""
+        try:
+            query_vector = await self.vector_store.embed_query(query)
+            await self.vector_store.cache_answer(query_vector, payload, started_at)
+        except Exception as e:
+            print(f"Answer cache write error: {e}")
+    
+    async def _retrieve(
+        self,
+        query: str,
+        timings: Dict[str, float],
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Retrieve and rerank chunks for a query, recording step timings.
+        
+        Returns:
+            Tuple of (retrieved chunks, reranked chunks)
+        """
+        # Step 1: Retrieve top-k chunks using vector similarity
+        retrieval_start = time.time()
+        use_mmr = settings.use_reranker and settings.use_mmr
+        search = self.vector_store.search(
+            query=query,
+            top_k=settings.top_k_retrieval,
+            score_threshold=settings.similarity_threshold,
+            with_vectors=use_mmr,
+        )
+        if settings.use_reranker:
+            # Open the reranker connection while the query is embedded/searched
+            retrieved_chunks, _ = await asyncio.gather(search, self.reranker.warmup())
+        else:
+            retrieved_chunks = await search
+        timings["retrieval"] = round(time.time() - retrieval_start, 2)
+        
+        if settings.debug:
+            print(f"Retrieved {len(retrieved_chunks)} chunks")
+            if retrieved_chunks:
+                print(f"Top score: {retrieved_chunks[0].get('score', 0)}")
+        
+        if not retrieved_chunks:
+            return [], []
+        
+        # Step 2a: Shrink to a diverse shortlist locally (MMR) so the
+        # reranker scores fewer, less redundant candidates
+        candidates = retrieved_chunks
+        if use_mmr and len(retrieved_chunks) > settings.top_k_rerank_input:
+            # Cache hit: search() just embedded this query
+            query_vector = await self.vector_store.embed_query(query)
+            selected = mmr_select(
+                query_vector,
+                [chunk["vector"] for chunk in retrieved_chunks],
+                k=settings.top_k_rerank_input,
+                lambda_mult=settings.mmr_lambda,
+            )
+            candidates = [retrieved_chunks[i] for i in selected]
+        
+        # Step 2b: Rerank candidates (if enabled). When every candidate fits
+        # in top_k_rerank, the vector-score order is kept to save a reranker
+        # round-trip; sources/confidence then follow that order.
+        if settings.use_reranker and len(candidates) > settings.top_k_rerank:
+            rerank_start = time.time()
+            reranked_chunks = await self.reranker.rerank(
+                query=query,
+                documents=candidates,
+                top_k=settings.top_k_rerank,
+            )
+            timings["reranking"] = round(time.time() - rerank_start, 2)
+        else:
+            reranked_chunks = candidates[:settings.top_k_rerank]
+            timings["reranking"] = 0
+        
+        return retrieved_chunks, reranked_chunks
+    
+    def clear_documents(self, document_ids: List[str]) -> Dict[str, Any]:
+        """Remove specific documents from the knowledge base."""
+        return self.vector_store.clear_documents(document_ids)
     
     def clear_all_data(self) -> Dict[str, Any]:
         """Clear all documents from the knowledge base."""
@@ -1,10 +1,13 @@
 """
-Reranker module using Jina AI Reranker API.
+Reranker module using Jina AI Reranker API or a local cross-encoder.
 Improves retrieval quality by reranking initial results.
 """
 
-from typing import List, Dict, Any
-import requests
+from typing import List, Dict, Any, Union
+import asyncio
+import httpx
+import numpy as np
+import orjson
 from config import settings
 
 
@@ -15,8 +18,34 @@ class JinaReranker:
         """Initialize Jina reranker with API key."""
         self.api_key = settings.jina_api_key
         self.api_url = "https://api.jina.ai/v1/rerank"
+        
+        # One pooled keep-alive client (HTTP/2) with auth headers preset,
+        # reused across requests so each rerank skips the TCP/TLS handshake
+        self.client = httpx.AsyncClient(
+            http2=True,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json",
+            },
+            timeout=30.0,
+        )
+        self._warmed = False
+    
+    async def warmup(self):
+        """Open the connection to Jina ahead of the first rerank (once per process)."""
+        if self._warmed:
+            return
+        self._warmed = True
+        try:
+            await self.client.head(self.api_url)
+        except httpx.HTTPError:
+            pass
+    
+    async def aclose(self):
+        """Close the pooled HTTP client."""
+        await self.client.aclose()
     
-    def rerank(
+    async def rerank(
         self, 
         query: str, 
         documents: List[Dict[str, Any]], 
@@ -36,15 +65,15 @@ class JinaReranker:
         if not documents:
             return []
         
+        # Everything fits in top_k: keep the vector-score order and skip
+        # the API round-trip
+        if len(documents) <= top_k:
+            return documents
+        
         # Extract texts for reranking
         texts = [doc["text"] for doc in documents]
         
         # Prepare request
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-        
         payload = {
             "model": "jina-reranker-v2-base-multilingual",
             "query": query,
@@ -53,19 +82,15 @@ class JinaReranker:
         }
         
         try:
-            # Call Jina reranker API
-            response = requests.post(
-                self.api_url, 
-                json=payload, 
-                headers=headers,
-                timeout=30
-            )
+            # Call Jina reranker API; orjson serializes the long document
+            # strings much faster than stdlib json
+            response = await self.client.post(self.api_url, content=orjson.dumps(payload))
             
             if response.status_code != 200:
                 print(f"Reranker API error: {response.status_code} - {response.text}")
                 return documents[:top_k]
             
-            result = response.json()
+            result = orjson.loads(response.content)
             
             # Map reranked results back to original documents
             reranked_docs = []
@@ -80,10 +105,99 @@ class JinaReranker:
             
             return reranked_docs
         
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Reranker API error: {e}")
             # Fallback: return original documents with their vector scores
             return documents[:top_k]
         except Exception as e:
             print(f"Reranking failed: {e}")
             return documents[:top_k]
+
+
+class LocalReranker:
+    """Reranks retrieved chunks with a local ONNX cross-encoder (e.g. int8 bge-reranker-base)."""
+    
+    def __init__(self):
+        """Load the ONNX model and its tokenizer."""
+        # Optional dependencies, only needed for the local backend
+        import onnxruntime
+        from transformers import AutoTokenizer
+        
+        self.session = onnxruntime.InferenceSession(
+            settings.local_reranker_model_path,
+            providers=["CUDAExecutionProvider", "CPUExecutionProvider"],
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(settings.local_reranker_tokenizer)
+        self.input_names = [inp.name for inp in self.session.get_inputs()]
+    
+    async def warmup(self):
+        """No connection to open for the local model."""
+        return
+    
+    async def aclose(self):
+        """Nothing to release for the local model."""
+        return
+    
+    def _score(self, query: str, texts: List[str]) -> np.ndarray:
+        """Score all query-document pairs in one batched inference call."""
+        encoded = self.tokenizer(
+            [[query, text] for text in texts],
+            padding=True,
+            truncation=True,
+            max_length=512,
+            return_tensors="np",
+        )
+        inputs = {name: encoded[name] for name in self.input_names}
+        logits = self.session.run(None, inputs)[0].reshape(-1)
+        # Sigmoid so scores land in [0, 1] like Jina's relevance_score
+        return 1.0 / (1.0 + np.exp(-logits))
+    
+    async def rerank(
+        self, 
+        query: str, 
+        documents: List[Dict[str, Any]], 
+        top_k: int = 5
+    ) -> List[Dict[str, Any]]:
+        """
+        Rerank documents based on relevance to query.
+        
+        Args:
+            query: User query
+            documents: List of document dictionaries with 'text' field
+            top_k: Number of top results to return
+        
+        Returns:
+            Reranked list of documents with relevance scores
+        """
+        if not documents:
+            return []
+        
+        # Everything fits in top_k: nothing to reorder
+        if len(documents) <= top_k:
+            return documents
+        
+        try:
+            texts = [doc["text"] for doc in documents]
+            # CPU/GPU-bound; keep it off the event loop
+            scores = await asyncio.to_thread(self._score, query, texts)
+            
+            reranked_docs = []
+            for idx in np.argsort(-scores)[:top_k]:
+                doc = documents[idx].copy()
+                doc["rerank_score"] = float(scores[idx])
+                reranked_docs.append(doc)
+            
+            return reranked_docs
+        
+        except Exception as e:
+            print(f"Reranking failed: {e}")
+            return documents[:top_k]
+
+
+def get_reranker() -> Union[JinaReranker, LocalReranker]:
+    """Create the reranker selected by settings.reranker_backend."""
+    if settings.reranker_backend == "local":
+        return LocalReranker()
+    if settings.reranker_backend == "jina":
+        return JinaReranker()
+    raise ValueError(f"Unknown reranker backend: {settings.reranker_backend}")
@@ -0,0 +1,142 @@
+"""
+Tests for the single-scan FastRecursiveSplitter.
+
+Uses a byte-level stand-in encoding so the tests run without downloading
+the cl100k_base tables: every byte is one token.
+"""
+
+import os
+import sys
+import unittest
+
+import tiktoken
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from chunker import DocumentChunker, FastRecursiveSplitter
+
+
+BYTE_ENCODING = tiktoken.Encoding(
+    name="bytes",
+    pat_str=r"[^\n]+|\n",
+    mergeable_ranks={bytes([i]): i for i in range(256)},
+    special_tokens={},
+)
+
+
+def make_splitter(chunk_size=100, chunk_overlap=0):
+    return FastRecursiveSplitter(BYTE_ENCODING, chunk_size, chunk_overlap)
+
+
+def token_len(text):
+    return len(BYTE_ENCODING.encode_ordinary(text))
+
+
+class FastRecursiveSplitterTest(unittest.TestCase):
+    
+    def test_empty_text(self):
+        self.assertEqual(make_splitter().split_text(""), [])
+        self.assertEqual(make_splitter().split_text("   \n\n  "), [])
+    
+    def test_short_text_is_one_chunk(self):
+        self.assertEqual(make_splitter().split_text("  Hello world.  "), ["Hello world."])
+    
+    def test_chunks_respect_chunk_size(self):
+        text = " ".join(f"word{i}" for i in range(2000))
+        chunks = make_splitter(chunk_size=100).split_text(text)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(token_len(chunk), 100)
+    
+    def test_no_text_lost_without_overlap(self):
+        words = [f"word{i}" for i in range(500)]
+        chunks = make_splitter(chunk_size=64).split_text(" ".join(words))
+        self.assertEqual(" ".join(chunks).split(), words)
+    
+    def test_prefers_paragraph_breaks(self):
+        para = "This is a sentence. " * 3
+        text = "\n\n".join(para.strip() for _ in range(6))
+        chunks = make_splitter(chunk_size=150).split_text(text)
+        for chunk in chunks:
+            self.assertTrue(chunk.endswith("sentence."), chunk)
+            self.assertFalse(chunk.startswith("is "), chunk)
+    
+    def test_sentence_break_keeps_period(self):
+        text = "First sentence here. Second sentence here. Third sentence here."
+        chunks = make_splitter(chunk_size=45).split_text(text)
+        self.assertEqual(chunks[0], "First sentence here. Second sentence here.")
+    
+    def test_hard_cut_without_separators(self):
+        text = "x" * 250
+        chunks = make_splitter(chunk_size=100).split_text(text)
+        self.assertEqual([len(c) for c in chunks], [100, 100, 50])
+    
+    def test_overlap_snaps_to_separator(self):
+        words = [f"w{i:03d}" for i in range(300)]
+        chunks = make_splitter(chunk_size=100, chunk_overlap=20).split_text(" ".join(words))
+        for left, right in zip(chunks, chunks[1:]):
+            first_word = right.split()[0]
+            self.assertIn(first_word, left.split())
+    
+    def test_overlap_kept_without_separators(self):
+        text = "".join(chr(ord("a") + i % 26) for i in range(1000))
+        chunks = make_splitter(chunk_size=100, chunk_overlap=20).split_text(text)
+        self.assertGreater(len(chunks), 1)
+        for left, right in zip(chunks, chunks[1:]):
+            self.assertEqual(left[-20:], right[:20])
+        self.assertTrue(text.endswith(chunks[-1]))
+    
+    def test_overlap_makes_progress(self):
+        text = " ".join(f"{i:02d}" + "a" * 28 for i in range(50))
+        chunks = make_splitter(chunk_size=40, chunk_overlap=35).split_text(text)
+        self.assertLess(len(chunks), 100)
+        for left, right in zip(chunks, chunks[1:]):
+            self.assertNotEqual(left, right)
+        self.assertTrue(text.endswith(chunks[-1]))
+    
+    def test_multibyte_text_stays_near_chunk_size(self):
+        text = "漢字かな交じり文。" * 200
+        for chunk in make_splitter(chunk_size=100).split_text(text):
+            # A cut inside a 3-byte character costs at most a few extra tokens
+            self.assertLessEqual(token_len(chunk), 100 + 4)
+
+
+class DocumentChunkerTest(unittest.TestCase):
+    
+    def test_chunk_text_metadata_and_stats(self):
+        chunker = DocumentChunker(
+            chunk_size=200, chunk_overlap=0, encoding=BYTE_ENCODING, min_chunk_tokens=50
+        )
+        text = "\n\n".join("Paragraph number %d has some text in it." % i for i in range(40))
+        chunks, stats = chunker.chunk_text(text, {"source": "doc.txt"})
+        
+        self.assertEqual(stats["total_chunks"], len(chunks))
+        for idx, chunk in enumerate(chunks):
+            self.assertEqual(chunk["metadata"]["source"], "doc.txt")
+            self.assertEqual(chunk["metadata"]["chunk_index"], idx)
+            self.assertEqual(chunk["metadata"]["token_count"], token_len(chunk["text"]))
+            self.assertLessEqual(chunk["metadata"]["token_count"], chunker.max_merged_tokens)
+    
+    def test_small_chunks_are_merged(self):
+        chunker = DocumentChunker(
+            chunk_size=100, chunk_overlap=0, encoding=BYTE_ENCODING, min_chunk_tokens=50
+        )
+        chunks, _ = chunker.chunk_texts(["Short page one.", "Short page two."])
+        self.assertEqual(len(chunks), 1)
+        self.assertIn("page one", chunks[0]["text"])
+        self.assertIn("page two", chunks[0]["text"])
+    
+    def test_chunk_documents_matches_chunk_text(self):
+        chunker = DocumentChunker(
+            chunk_size=100, chunk_overlap=10, encoding=BYTE_ENCODING, min_chunk_tokens=20
+        )
+        texts = ["Alpha beta gamma. " * 30, "", "Delta epsilon. " * 50]
+        results = chunker.chunk_documents(texts)
+        
+        self.assertEqual(len(results), len(texts))
+        for text, result in zip(texts, results):
+            self.assertEqual(result, chunker.chunk_text(text))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+Tests for LLMGenerator's streamed token usage.
+
+Needs the backend dependencies (pydantic-settings, langchain-core); the
+model is replaced by a fake that streams canned chunks.
+"""
+
+import asyncio
+import importlib.util
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+for key in ("GOOGLE_API_KEY", "QDRANT_URL", "QDRANT_API_KEY", "JINA_API_KEY"):
+    os.environ.setdefault(key, "test")
+
+HAS_DEPS = all(
+    importlib.util.find_spec(name) for name in ("pydantic_settings", "langchain_core")
+)
+
+
+class FakeModel:
+    """Streams fixed chunks the way ChatGoogleGenerativeAI.astream does."""
+    
+    def __init__(self, chunks):
+        self.chunks = chunks
+    
+    async def astream(self, messages):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def make_chunk(content, input_tokens=None, output_tokens=None):
+    usage = None
+    if input_tokens is not None:
+        usage = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+    return SimpleNamespace(content=content, usage_metadata=usage)
+
+
+def collect(generator):
+    async def run():
+        return [event async for event in generator]
+    return asyncio.run(run())
+
+
+CONTEXT = [{"text": "Paris is the capital of France.", "score": 0.9, "metadata": {"source": "a.txt"}}]
+
+
+@unittest.skipUnless(HAS_DEPS, "backend dependencies not installed")
+class StreamUsageTest(unittest.TestCase):
+    
+    def make_generator(self, chunks):
+        from llm import LLMGenerator
+        
+        generator = LLMGenerator.__new__(LLMGenerator)
+        generator.model = FakeModel(chunks)
+        return generator
+    
+    def test_cumulative_usage_is_not_summed(self):
+        generator = self.make_generator([
+            make_chunk("Paris ", 120, 2),
+            make_chunk("is the ", 120, 5),
+            make_chunk("capital [1].", 120, 9),
+        ])
+        events = collect(generator.generate_answer_stream("Capital of France?", CONTEXT))
+        
+        tokens = "".join(e["text"] for e in events if e["type"] == "token")
+        self.assertEqual(tokens, "Paris is the capital [1].")
+        usage = [e for e in events if e["type"] == "usage"]
+        self.assertEqual(usage, [{"type": "usage", "prompt_tokens": 120, "completion_tokens": 9}])
+    
+    def test_usage_only_on_final_chunk(self):
+        generator = self.make_generator([
+            make_chunk("Paris."),
+            make_chunk("", 80, 3),
+        ])
+        events = collect(generator.generate_answer_stream("Capital of France?", CONTEXT))
+        
+        self.assertEqual(events[-1], {"type": "usage", "prompt_tokens": 80, "completion_tokens": 3})
+    
+    def test_no_usage_event_without_metadata(self):
+        generator = self.make_generator([make_chunk("Paris.")])
+        events = collect(generator.generate_answer_stream("Capital of France?", CONTEXT))
+        
+        self.assertNotIn("usage", [e["type"] for e in events])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,23 +3,174 @@ Vector store module using Qdrant Cloud.
 Handles embedding generation and vector storage.
 """
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator
 from qdrant_client import QdrantClient
 from qdrant_client.models import (
     Distance,
     VectorParams,
-    PointStruct,
     Filter,
     FieldCondition,
     MatchValue,
+    MatchAny,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    QuantizationSearchParams,
+    HnswConfigDiff,
+    PayloadSchemaType,
+    PointStruct,
+    Range,
 )
+import numpy as np
 import google.generativeai as genai
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from google.api_core import exceptions as google_exceptions
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from config import settings
+import asyncio
+import hashlib
+import os
+import threading
 import uuid
 import time
 
 
+# Payload fields used in filters; each gets a keyword index
+INDEXED_PAYLOAD_FIELDS = ("document_id", "source", "title")
+
+# Payload fields search results actually use; everything else stays server-side
+SEARCH_PAYLOAD_FIELDS = ["text", "document_id", "source", "title", "chunk_index", "token_count"]
+
+# Fixed point id in the answer cache holding the last invalidation time
+ANSWER_CACHE_MARKER_ID = "00000000-0000-0000-0000-000000000001"
+
+# Upper bound on distinct values returned by a /stats facet query
+STATS_FACET_LIMIT = 10000
+
+# Gemini errors worth retrying: rate limits (429) and transient 5xx
+RETRYABLE_EMBED_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+)
+
+
+_uuid7_lock = threading.Lock()
+_uuid7_last_ms = 0
+_uuid7_seq = 0
+
+
+def uuid7() -> str:
+    """
+    Time-ordered UUIDv7 string (RFC 9562).
+    
+    Ids from one ingest sort by insertion time, so consecutive points land
+    near each other in Qdrant's id map. Within a millisecond the 12-bit
+    rand_a field is used as a counter to keep ids monotonic.
+    """
+    global _uuid7_last_ms, _uuid7_seq
+    with _uuid7_lock:
+        ts_ms = time.time_ns() // 1_000_000
+        if ts_ms > _uuid7_last_ms:
+            _uuid7_last_ms = ts_ms
+            _uuid7_seq = int.from_bytes(os.urandom(2), "big") & 0x7FF
+        else:
+            _uuid7_seq += 1
+            if _uuid7_seq > 0xFFF:
+                # Counter exhausted: borrow the next millisecond
+                _uuid7_last_ms += 1
+                _uuid7_seq = 0
+        ts_ms, seq = _uuid7_last_ms, _uuid7_seq
+    
+    rand_b = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    value = (
+        (ts_ms & ((1 << 48) - 1)) << 80
+        | 0x7 << 76
+        | seq << 64
+        | 0b10 << 62
+        | rand_b
+    )
+    return str(uuid.UUID(int=value))
+
+
+def mmr_select(
+    query_vector: List[float],
+    candidate_vectors: List[List[float]],
+    k: int,
+    lambda_mult: float = 0.5,
+) -> List[int]:
+    """
+    Pick k diverse, relevant candidates with Maximal Marginal Relevance.
+    
+    Args:
+        query_vector: Query embedding
+        candidate_vectors: Candidate embeddings
+        k: Number of candidates to select
+        lambda_mult: 1.0 = pure relevance, 0.0 = pure diversity
+    
+    Returns:
+        Indices of selected candidates, in selection order
+    """
+    q = np.asarray(query_vector, dtype=np.float32)
+    C = np.asarray(candidate_vectors, dtype=np.float32)
+    q = q / max(float(np.linalg.norm(q)), 1e-12)
+    C = C / np.clip(np.linalg.norm(C, axis=1, keepdims=True), 1e-12, None)
+    
+    sim_q = C @ q
+    sim_cc = C @ C.T
+    k = min(k, len(C))
+    
+    selected = [int(np.argmax(sim_q))]
+    # Highest similarity of each candidate to anything already selected
+    max_sim = sim_cc[selected[0]].copy()
+    while len(selected) < k:
+        scores = lambda_mult * sim_q - (1 - lambda_mult) * max_sim
+        scores[selected] = -np.inf
+        idx = int(np.argmax(scores))
+        selected.append(idx)
+        max_sim = np.maximum(max_sim, sim_cc[idx])
+    
+    return selected
+
+
+class EmbeddingCache:
+    """Thread-safe LRU cache of embeddings keyed by content hash."""
+    
+    def __init__(self, maxsize: int = 4096):
+        """
+        Initialize cache.
+        
+        Args:
+            maxsize: Maximum number of vectors to keep
+        """
+        self.maxsize = maxsize
+        self._data: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key(task_type: str, model: str, text: str) -> tuple:
+        """Build a cache key from task type, model, and SHA-256 of the text."""
+        return (task_type, model, hashlib.sha256(text.encode("utf-8")).digest())
+    
+    def get(self, key: tuple) -> Optional[np.ndarray]:
+        """Return the cached vector, or None on a miss."""
+        with self._lock:
+            vector = self._data.get(key)
+            if vector is not None:
+                self._data.move_to_end(key)
+            return vector
+    
+    def put(self, key: tuple, vector: np.ndarray):
+        """Store a vector, evicting the least recently used entry if full."""
+        with self._lock:
+            self._data[key] = vector
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
 class VectorStore:
     """Manages vector embeddings and Qdrant Cloud storage."""
     
@@ -32,57 +183,170 @@ class VectorStore:
         self.qdrant_client = QdrantClient(
             url=settings.qdrant_url,
             api_key=settings.qdrant_api_key,
+            prefer_grpc=True,
         )
         
-        # Initialize embeddings
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model=settings.embedding_model,
-            google_api_key=settings.google_api_key,
-        )
+        self.embedding_model = settings.embedding_model
+        self.embedding_batch_size = settings.embedding_batch_size
+        # float32 vectors for repeated queries and duplicate chunks
+        self._embedding_cache = EmbeddingCache(maxsize=settings.embedding_cache_size)
         
         self.collection_name = settings.collection_name
         
+        # Semantic answer cache lives in its own small collection
+        self.query_cache_name = settings.query_cache_collection
+        self._query_cache_ready = False
+        
         # Ensure collection exists
         self._ensure_collection()
     
     def _ensure_collection(self):
-        """Create collection if it doesn't exist."""
+        """Create collection (and its payload indexes) if they don't exist."""
         collections = self.qdrant_client.get_collections()
         collection_names = [col.name for col in collections.collections]
         
-        if self.collection_name not in collection_names:
+        if self.collection_name in collection_names:
+            existing = self.qdrant_client.get_collection(self.collection_name).payload_schema or {}
+            self._ensure_payload_indexes(existing)
+        else:
             self.qdrant_client.create_collection(
                 collection_name=self.collection_name,
                 vectors_config=VectorParams(
                     size=settings.vector_dimensions,
                     distance=Distance.COSINE,
                 ),
+                hnsw_config=HnswConfigDiff(
+                    m=settings.hnsw_m,
+                    ef_construct=settings.hnsw_ef_construct,
+                ),
+                # int8 vectors kept in RAM for search; originals used for rescoring
+                quantization_config=ScalarQuantization(
+                    scalar=ScalarQuantizationConfig(
+                        type=ScalarType.INT8,
+                        quantile=0.99,
+                        always_ram=True,
+                    ),
+                ),
             )
             print(f"Created collection: {self.collection_name}")
+            self._ensure_payload_indexes({})
+    
+    def _ensure_payload_indexes(self, existing: Dict[str, Any]):
+        """Create keyword indexes on filter fields so filtered deletes/queries skip full scans."""
+        for field_name in INDEXED_PAYLOAD_FIELDS:
+            if field_name in existing:
+                continue
+            try:
+                self.qdrant_client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=PayloadSchemaType.KEYWORD,
+                )
+            except Exception as e:
+                # Another instance may have created it concurrently
+                if "already exists" not in str(e).lower():
+                    raise
     
     def embed_texts(self, texts: List[str]) -> List[List[float]]:
         """
         Generate embeddings for a list of texts.
         
+        Texts are sent in batches of embedding_batch_size, one
+        batchEmbedContents request per batch.
+        
         Args:
             texts: List of text strings to embed
         
         Returns:
             List of embedding vectors
         """
-        return self.embeddings.embed_documents(texts)
+        return [
+            vector
+            for batch_vectors in self._iter_embedding_batches(texts)
+            for vector in batch_vectors
+        ]
+    
+    def _iter_embedding_batches(self, texts: List[str]) -> Iterator[List[List[float]]]:
+        """Yield embeddings batch by batch, in input order, as each completes."""
+        batches = [
+            texts[i:i + self.embedding_batch_size]
+            for i in range(0, len(texts), self.embedding_batch_size)
+        ]
+        
+        if len(batches) <= 1:
+            for batch in batches:
+                yield self._embed_batch_cached(batch)
+            return
+        
+        # Batches are independent I/O; dispatch them concurrently,
+        # bounded to stay within the provider's rate limit
+        workers = min(settings.embed_concurrency, len(batches))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(self._embed_batch_cached, batches)
+    
+    def _embed_batch_cached(self, batch: List[str]) -> List[np.ndarray]:
+        """Embed one batch, sending only cache misses (deduplicated) to the API."""
+        keys = [
+            EmbeddingCache.key("retrieval_document", self.embedding_model, text)
+            for text in batch
+        ]
+        vectors = [self._embedding_cache.get(key) for key in keys]
+        misses = [i for i, vector in enumerate(vectors) if vector is None]
+        
+        if misses:
+            unique_texts = list(dict.fromkeys(batch[i] for i in misses))
+            fresh = dict(zip(unique_texts, self._embed_batch(unique_texts)))
+            for i in misses:
+                vector = np.asarray(fresh[batch[i]], dtype=np.float32)
+                vectors[i] = vector
+                self._embedding_cache.put(keys[i], vector)
+        
+        return vectors
+    
+    def _embed_batch(self, batch: List[str], max_retries: int = 5) -> List[List[float]]:
+        """Embed one batch, backing off exponentially on 429/5xx errors."""
+        for attempt in range(max_retries):
+            try:
+                result = genai.embed_content(
+                    model=self.embedding_model,
+                    content=batch,
+                    task_type="retrieval_document",
+                )
+                return result["embedding"]
+            except RETRYABLE_EMBED_ERRORS as e:
+                if attempt == max_retries - 1:
+                    raise
+                wait_time = 2 ** attempt  # 1s, 2s, 4s, 8s
+                print(f"Embedding error ({e}), retrying in {wait_time}s...")
+                time.sleep(wait_time)
     
-    def embed_query(self, query: str) -> List[float]:
+    async def embed_query(self, query: str) -> List[float]:
         """
         Generate embedding for a query.
         
+        Uses the retrieval_query task type so queries and documents get
+        asymmetric embeddings.
+        
         Args:
             query: Query string
         
         Returns:
             Embedding vector
         """
-        return self.embeddings.embed_query(query)
+        key = EmbeddingCache.key("retrieval_query", self.embedding_model, query)
+        vector = self._embedding_cache.get(key)
+        
+        if vector is None:
+            result = await asyncio.to_thread(
+                genai.embed_content,
+                model=self.embedding_model,
+                content=query,
+                task_type="retrieval_query",
+            )
+            vector = np.asarray(result["embedding"], dtype=np.float32)
+            self._embedding_cache.put(key, vector)
+        
+        return vector.tolist()
     
     def add_chunks(
         self, 
@@ -106,37 +370,58 @@ class VectorStore:
         
         # Generate document ID if not provided
         if not document_id:
-            document_id = str(uuid.uuid4())
+            document_id = uuid7()
         
-        # Extract texts
+        # Column layout: flat lists of texts, payloads and ids, plus a
+        # float32 matrix per embedding batch. Payloads are one dict copy of
+        # the metadata each; upload_collection turns them straight into gRPC
+        # points, so no pydantic PointStruct is built per chunk. The chunk's
+        # text and document_id take precedence over same-named metadata keys,
+        # so delete/clear filters always match what was stored.
         texts = [chunk["text"] for chunk in chunks]
+        payloads = [
+            dict(chunk["metadata"], text=text, document_id=document_id)
+            for text, chunk in zip(texts, chunks)
+        ]
+        ids = [uuid7() for _ in texts]
         
-        # Generate embeddings
-        embeddings = self.embed_texts(texts)
+        # Upload embeddings while the remaining embed calls run, buffered
+        # to upsert_batch_size points per request. Vectors are packed into
+        # float32 arrays, which the client sends without per-float objects.
+        buffered: List[List[float]] = []
+        uploaded = 0
+        try:
+            for batch_vectors in self._iter_embedding_batches(texts):
+                buffered.extend(batch_vectors)
+                done = uploaded + len(buffered) == len(texts)
+                if len(buffered) < settings.upsert_batch_size and not done:
+                    continue
+                
+                vectors = np.asarray(buffered, dtype=np.float32)
+                start, uploaded = uploaded, uploaded + len(vectors)
+                buffered = []
+                
+                self.qdrant_client.upload_collection(
+                    collection_name=self.collection_name,
+                    vectors=vectors,
+                    payload=payloads[start:uploaded],
+                    ids=ids[start:uploaded],
+                    batch_size=settings.upsert_batch_size,
+                    # Only the last upload waits, so everything is persisted
+                    # before returning
+                    wait=done,
+                )
+        except Exception:
+            # All-or-nothing: drop the batches already uploaded so a retried
+            # ingest does not leave a partial duplicate behind
+            if uploaded:
+                try:
+                    self.delete_document(document_id)
+                except Exception as e:
+                    print(f"Error rolling back partial ingest of {document_id}: {e}")
+            raise
         
-        # Prepare points for Qdrant
-        points = []
-        for idx, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            point_id = str(uuid.uuid4())
-            
-            payload = {
-                "text": chunk["text"],
-                "document_id": document_id,
-                **chunk["metadata"],
-            }
-            
-            point = PointStruct(
-                id=point_id,
-                vector=embedding,
-                payload=payload,
-            )
-            points.append(point)
-        
-        # Upsert to Qdrant
-        self.qdrant_client.upsert(
-            collection_name=self.collection_name,
-            points=points,
-        )
+        self.invalidate_answer_cache()
         
         elapsed_time = time.time() - start_time
         
@@ -147,11 +432,12 @@ class VectorStore:
             "time_seconds": round(elapsed_time, 2),
         }
     
-    def search(
+    async def search(
         self, 
         query: str, 
         top_k: int = 10,
         score_threshold: Optional[float] = None,
+        with_vectors: bool = False,
     ) -> List[Dict[str, Any]]:
         """
         Search for relevant chunks using vector similarity.
@@ -160,20 +446,33 @@ class VectorStore:
             query: Query string
             top_k: Number of results to return
             score_threshold: Minimum similarity score
+            with_vectors: Also return each hit's stored vector (under "vector")
         
         Returns:
             List of results with text, metadata, and scores
         """
         # Generate query embedding
-        query_embedding = self.embed_query(query)
+        query_embedding = await self.embed_query(query)
         
-        # Search in Qdrant using query method
+        # Search in Qdrant using query method (sync client, run off the loop)
         try:
-            search_response = self.qdrant_client.query_points(
+            search_response = await asyncio.to_thread(
+                self.qdrant_client.query_points,
                 collection_name=self.collection_name,
                 query=query_embedding,
                 limit=top_k,
                 score_threshold=score_threshold,
+                with_payload=SEARCH_PAYLOAD_FIELDS,
+                with_vectors=with_vectors,
+                # Oversample on quantized vectors, then rescore with full
+                # precision to preserve recall
+                search_params=SearchParams(
+                    hnsw_ef=settings.hnsw_ef_search,
+                    quantization=QuantizationSearchParams(
+                        rescore=True,
+                        oversampling=2.0,
+                    ),
+                ),
             )
             search_results = search_response.points if hasattr(search_response, 'points') else search_response
         except Exception as e:
@@ -195,6 +494,8 @@ class VectorStore:
                     if k != "text"
                 },
             }
+            if with_vectors:
+                result["vector"] = hit.vector
             results.append(result)
         
         return results
@@ -221,10 +522,234 @@ class VectorStore:
             ),
         )
         
+        self.invalidate_answer_cache()
+        
         return {"status": "success", "document_id": document_id}
     
+    def clear_documents(self, document_ids: List[str]) -> Dict[str, Any]:
+        """
+        Delete all chunks for several documents in one server-side filtered delete.
+        
+        Keeps the collection and its HNSW index in place, unlike clear_collection.
+        
+        Args:
+            document_ids: Document identifiers
+        
+        Returns:
+            Deletion status
+        """
+        if not document_ids:
+            return {"status": "success", "document_ids": []}
+        
+        self.qdrant_client.delete(
+            collection_name=self.collection_name,
+            points_selector=Filter(
+                must=[
+                    FieldCondition(
+                        key="document_id",
+                        match=MatchAny(any=document_ids),
+                    )
+                ]
+            ),
+        )
+        
+        self.invalidate_answer_cache()
+        
+        return {"status": "success", "document_ids": document_ids}
+    
     def clear_collection(self):
         """Clear all documents from collection."""
+        print(
+            f"Warning: dropping and recreating collection {self.collection_name}; "
+            "the index is rebuilt from scratch (use clear_documents for partial clears)"
+        )
         self.qdrant_client.delete_collection(self.collection_name)
         self._ensure_collection()
+        self.invalidate_answer_cache()
         return {"status": "success", "message": "Collection cleared"}
+
+    def _facet_values(self, key: str) -> List[Any]:
+        """
+        Distinct values of a keyword-indexed payload field, counted by Qdrant.
+        
+        Returns at most STATS_FACET_LIMIT values.
+        """
+        response = self.qdrant_client.facet(
+            collection_name=self.collection_name,
+            key=key,
+            limit=STATS_FACET_LIMIT,
+            exact=True,
+        )
+        return [hit.value for hit in response.hits]
+    
+    def get_document_stats(self) -> Dict[str, Any]:
+        """
+        Get unique document and source counts from Qdrant's keyword indexes.
+        
+        Facets on the indexed document_id/source fields, so the counts are
+        shared by every instance and no points are scrolled. Each count is
+        capped at STATS_FACET_LIMIT; "truncated" is True when a cap was hit
+        and the real number may be higher.
+        
+        Returns:
+            Dictionary with unique_documents, unique_sources, source_names,
+            and truncated
+        """
+        document_ids = self._facet_values("document_id")
+        sources = self._facet_values("source")
+        return {
+            "unique_documents": len(document_ids),
+            "unique_sources": len(sources),
+            "source_names": sources,
+            "truncated": max(len(document_ids), len(sources)) >= STATS_FACET_LIMIT,
+        }
+    
+    def _ensure_answer_cache(self):
+        """Create the answer cache collection if needed."""
+        if self._query_cache_ready:
+            return
+        collections = self.qdrant_client.get_collections()
+        if self.query_cache_name not in [col.name for col in collections.collections]:
+            self.qdrant_client.create_collection(
+                collection_name=self.query_cache_name,
+                vectors_config=VectorParams(
+                    size=settings.vector_dimensions,
+                    distance=Distance.COSINE,
+                ),
+            )
+            self.qdrant_client.create_payload_index(
+                collection_name=self.query_cache_name,
+                field_name="ts",
+                field_schema=PayloadSchemaType.FLOAT,
+            )
+        self._query_cache_ready = True
+    
+    async def lookup_cached_answer(self, query_vector: List[float]) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached answer for a near-identical earlier query.
+        
+        Args:
+            query_vector: Query embedding
+        
+        Returns:
+            Cached answer payload, or None on a miss
+        """
+        def lookup():
+            self._ensure_answer_cache()
+            return self.qdrant_client.query_points(
+                collection_name=self.query_cache_name,
+                query=query_vector,
+                limit=1,
+                score_threshold=settings.query_cache_threshold,
+                query_filter=Filter(
+                    must=[
+                        FieldCondition(
+                            key="ts",
+                            range=Range(gte=time.time() - settings.query_cache_ttl_seconds),
+                        )
+                    ]
+                ),
+                with_payload=True,
+            ).points
+        
+        try:
+            hits = await asyncio.to_thread(lookup)
+        except Exception as e:
+            print(f"Answer cache lookup error: {e}")
+            self._query_cache_ready = False
+            return None
+        
+        return hits[0].payload if hits else None
+    
+    async def cache_answer(
+        self,
+        query_vector: List[float],
+        answer: Dict[str, Any],
+        computed_at: float,
+    ):
+        """
+        Store an answer for semantic reuse and evict expired entries.
+        
+        Answers computed before the last invalidation are dropped, so a
+        query that was in flight during an ingest cannot repopulate the cache.
+        
+        Args:
+            query_vector: Query embedding
+            answer: Payload to return on future hits (answer, sources, confidence)
+            computed_at: Time the query started; stored as the entry's "ts"
+        """
+        def store():
+            self._ensure_answer_cache()
+            marker = self.qdrant_client.retrieve(
+                collection_name=self.query_cache_name,
+                ids=[ANSWER_CACHE_MARKER_ID],
+                with_payload=True,
+            )
+            if marker and marker[0].payload.get("invalidated_at", 0) >= computed_at:
+                return
+            
+            self.qdrant_client.upsert(
+                collection_name=self.query_cache_name,
+                points=[
+                    PointStruct(
+                        id=uuid7(),
+                        vector=query_vector,
+                        payload={**answer, "ts": computed_at},
+                    )
+                ],
+                wait=False,
+            )
+            # TTL eviction: one server-side filtered delete
+            self._delete_cached_answers(before=time.time() - settings.query_cache_ttl_seconds)
+        
+        try:
+            await asyncio.to_thread(store)
+        except Exception as e:
+            print(f"Answer cache store error: {e}")
+            self._query_cache_ready = False
+    
+    def invalidate_answer_cache(self):
+        """
+        Drop cached answers; called whenever the knowledge base changes.
+        
+        The collection itself is kept so other instances can keep using it.
+        The invalidation time is recorded in a marker point first, which
+        cache_answer checks before storing.
+        """
+        if not settings.use_query_cache:
+            return
+        invalidated_at = time.time()
+        try:
+            self._ensure_answer_cache()
+            self.qdrant_client.upsert(
+                collection_name=self.query_cache_name,
+                points=[
+                    PointStruct(
+                        id=ANSWER_CACHE_MARKER_ID,
+                        # Any non-zero vector; the marker has no "ts", so
+                        # lookups and TTL eviction never match it
+                        vector=[1.0] + [0.0] * (settings.vector_dimensions - 1),
+                        payload={"invalidated_at": invalidated_at},
+                    )
+                ],
+                wait=True,
+            )
+            self._delete_cached_answers(before=invalidated_at)
+        except Exception as e:
+            print(f"Answer cache invalidation error: {e}")
+            self._query_cache_ready = False
+    
+    def _delete_cached_answers(self, before: float):
+        """Delete cached answers older than "before" in one filtered delete."""
+        self.qdrant_client.delete(
+            collection_name=self.query_cache_name,
+            points_selector=Filter(
+                must=[
+                    FieldCondition(
+                        key="ts",
+                        range=Range(lt=before),
+                    )
+                ]
+            ),
+            wait=False,
+        )